@@ -1,21 +1,99 @@
 #!/usr/bin/env python3
 
+import glob
+import os
 import sys
+import tempfile
 import typing
 import json
+import re
 import subprocess
 from traceback import format_exc
-from typing import Union
+from typing import Tuple, Union
 from pathlib import Path
 
 from arcaflow_plugin_sdk import plugin
+import fio_schema
 from fio_schema import (
     FioInput,
     FioSuccessOutput,
     FioErrorOutput,
-    fio_output_schema,
 )
 
+json_decoder = json.JSONDecoder()
+json_start_pattern = re.compile(r"^[ \t]*\{", re.MULTILINE)
+
+
+def split_json_and_errors(fio_output: str) -> Tuple[dict, str]:
+    """Splits the fio output into the JSON report and any informational or
+    error messages that fio wrote ahead of it.
+
+    :param fio_output: the raw contents of the fio output file
+    :return: the decoded JSON report and the text that preceded it
+    """
+    # The report always starts on a line of its own, so only attempt to
+    # decode at braces that open a line rather than at every brace that
+    # appears in a message.
+    for match in json_start_pattern.finditer(fio_output):
+        idx = match.end() - 1
+        try:
+            json_data, _ = json_decoder.raw_decode(fio_output, idx)
+            return json_data, fio_output[:idx]
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("no JSON object found in fio output")
+
+
+def job_data_files(job_name: str) -> typing.List[Path]:
+    """Lists the data files fio created for a job.
+
+    :param job_name: the name of the fio job, which may include a directory
+    :return: the paths named <job_name>.<clone number>.<file number>
+    """
+    # Job names may be paths, so scan the directory they point to for
+    # files starting with their base name. The glob only narrows the scan;
+    # "[0-9]*" would also match names such as "<job_name>.1.2.bak", so each
+    # candidate is checked exactly.
+    job_path = Path(job_name)
+    data_file_pattern = re.compile(
+        rf"{re.escape(job_path.name)}\.\d+\.\d+", re.ASCII
+    )
+    return [
+        data_file
+        for data_file in job_path.parent.glob(
+            f"{glob.escape(job_path.name)}.*.*"
+        )
+        if data_file_pattern.fullmatch(data_file.name)
+    ]
+
+
+def read_fio_messages(outfile_path: typing.Optional[Path]) -> str:
+    """Reads what a failed fio run wrote to its output file, which is where
+    fio puts most of its error messages.
+
+    :param outfile_path: the fio output file, or None if it was not created
+    :return: the contents of the file, or an empty string if it is unreadable
+    """
+    if outfile_path is None:
+        return ""
+    try:
+        return outfile_path.read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def remove_files(paths: typing.Iterable[Path]):
+    """Removes files left behind by a run, reporting rather than raising
+    any failure so that cleanup cannot replace the step's result.
+
+    :param paths: the files to remove; missing files are ignored
+    """
+    for path in paths:
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as exc:
+            sys.stderr.write(f"could not remove {path}: {exc}\n")
+
 
 @plugin.step(
     id="workload",
@@ -26,30 +104,61 @@ from fio_schema import (
 def run(
     params: FioInput,
 ) -> typing.Tuple[str, Union[FioSuccessOutput, FioErrorOutput]]:
+    outfile_temp_path: typing.Optional[Path] = None
     try:
-        outfile_temp_path = Path("fio-plus.json")
-        infile_temp_path = Path("fio-input-tmp.fio")
-        params.write_jobs_to_file(infile_temp_path)
+        # A unique output file name keeps concurrent runs in the same working
+        # directory from overwriting each other's results.
+        outfile_fd, outfile_name = tempfile.mkstemp(
+            prefix="fio-plus-", suffix=".json", dir="."
+        )
+        os.close(outfile_fd)
+        outfile_temp_path = Path(outfile_name)
+        # fio reads the job file from stdin when it is given as "-"
         cmd = [
             "fio",
-            f"{infile_temp_path}",
-            "--output-format=json+",
+            "-",
+            (
+                "--output-format=json+"
+                if params.include_histograms
+                else "--output-format=json"
+            ),
             f"--output={outfile_temp_path}",
         ]
-        subprocess.check_output(cmd)
-        output: FioSuccessOutput = fio_output_schema.unserialize(
-            json.loads(outfile_temp_path.read_text())
+        result = subprocess.run(
+            cmd,
+            input=params.jobs_to_string().encode("utf-8"),
+            check=True,
+            capture_output=True,
+        )
+        # Pass fio's warnings through, as they were before stderr was
+        # captured for the error output, even if the report turns out to be
+        # unusable
+        sys.stderr.write(result.stderr.decode(errors="replace"))
+        json_data, error_data = split_json_and_errors(
+            outfile_temp_path.read_text(encoding="utf-8")
+        )
+        if error_data:
+            sys.stderr.write(error_data)
+        output: FioSuccessOutput = fio_schema.fio_output_schema.unserialize(
+            json_data
         )
 
         return "success", output
 
     except FileNotFoundError as exc:
         if exc.filename == "fio":
-            error_output: FioErrorOutput = FioErrorOutput(
+            return "error", FioErrorOutput(
                 "missing fio executable, please install fio package"
             )
-        else:
-            error_output: FioErrorOutput = FioErrorOutput(format_exc())
+        error_output: FioErrorOutput = FioErrorOutput(format_exc())
+        return "error", error_output
+
+    except subprocess.CalledProcessError as exc:
+        error_output: FioErrorOutput = FioErrorOutput(
+            f"fio exited with status {exc.returncode}:\n"
+            f"{exc.stderr.decode(errors='replace')}"
+            f"{read_fio_messages(outfile_temp_path)}"
+        )
         return "error", error_output
 
     except Exception:
@@ -58,10 +167,11 @@ def run(
 
     finally:
         if params.cleanup:
-            infile_temp_path.unlink(missing_ok=True)
-            outfile_temp_path.unlink(missing_ok=True)
+            if outfile_temp_path is not None:
+                remove_files([outfile_temp_path])
             for job in params.jobs:
-                Path(job.name + ".0.0").unlink(missing_ok=True)
+                # numjobs and nrfiles produce more than just <jobname>.0.0
+                remove_files(job_data_files(job.name))
 
 
 if __name__ == "__main__":
@@ -3,9 +3,9 @@
 import typing
 import re
 import enum
-import configparser
-from dataclasses import dataclass, field, asdict
-from typing import Optional, Dict
+import operator
+from dataclasses import dataclass, field
+from typing import Optional
 from pathlib import Path
 
 from arcaflow_plugin_sdk import plugin, schema, validation
@@ -58,23 +58,21 @@ class IoEngine(str, enum.Enum):
 
 
 duration_pattern_string = r"[0-9]+(?:d|h|m|s|ms|us)?"
-duration_pattern = re.compile(rf"^{duration_pattern_string}$")
+duration_pattern = re.compile(rf"^{duration_pattern_string}$", re.ASCII)
 duration_range_pattern = re.compile(
-    rf"^{duration_pattern_string}(?:-{duration_pattern_string})?$"
+    rf"^{duration_pattern_string}(?:-{duration_pattern_string})?$", re.ASCII
 )
 
-size_pattern_string = (
-    r"0x[0-9a-fA-F]+|"
-    r"\d+(?:k|kb|ki|kib|m|mb|mi|mib|g|gb|gi|gib|t|tb|ti|tib|p|pb|pi|pib)?"
-)
+# Unit suffixes are k, ki, kb, or kib (likewise for m, g, t, and p)
+size_pattern_string = r"0x[0-9a-fA-F]+|\d+(?:[kmgtp]i?b?)?"
 size_pattern = re.compile(
     rf"^(?:{size_pattern_string})(?:,(?:{size_pattern_string})){{0,2}}$",
-    re.IGNORECASE,
+    re.IGNORECASE | re.ASCII,
 )
 
 size_pattern_with_percent_string = rf"{size_pattern_string}|[1-9][0-9]?%|100%"
 size_pattern_with_percent = re.compile(
-    rf"^(?:{size_pattern_with_percent_string})$", re.IGNORECASE
+    rf"^(?:{size_pattern_with_percent_string})$", re.IGNORECASE | re.ASCII
 )
 
 size_range_pattern_string = (
@@ -82,13 +80,13 @@ size_range_pattern_string = (
 )
 size_range_pattern = re.compile(
     rf"^{size_range_pattern_string}$",
-    re.IGNORECASE,
+    re.IGNORECASE | re.ASCII,
 )
 
 size_multi_range_pattern = re.compile(
     rf"^{size_range_pattern_string}"
     rf"(?:,{size_range_pattern_string}){{0,2}}$",
-    re.IGNORECASE,
+    re.IGNORECASE | re.ASCII,
 )
 
 path_pattern = re.compile(r"^[^:]+(?::[^:]+)*$")
@@ -480,6 +478,46 @@ class JobParams:
     ] = None
 
 
+bool_param_strings = ("0", "1")
+
+
+def int_param_to_str(value) -> str:
+    """Formats an integer job parameter, including integer enums, for fio.
+
+    :param value: the integer or integer enum member
+    :return: the plain decimal string
+    """
+    return str(int(value))
+
+
+def job_param_formatter(hint) -> typing.Callable[[typing.Any], str]:
+    """Picks the function that formats values of a job parameter for fio.
+
+    :param hint: the Optional[X] type hint of a JobParams field
+    :return: a function turning a value of X into its job file string
+    """
+    # fio expects booleans and integer enums such as KbBase as plain
+    # integers, string enums as their value, and everything else as its
+    # string.
+    (param_type,) = (t for t in typing.get_args(hint) if t is not type(None))
+    if issubclass(param_type, bool):
+        # bool is an int subclass, so it indexes the two cached strings
+        return bool_param_strings.__getitem__
+    if issubclass(param_type, int):
+        return int_param_to_str
+    if issubclass(param_type, enum.Enum):
+        return operator.attrgetter("value")
+    return str
+
+
+# The job parameter types are fixed, so pick each field's formatter once
+# instead of checking the value type for every field of every job.
+job_params_formatters = {
+    name: job_param_formatter(hint)
+    for name, hint in typing.get_type_hints(JobParams).items()
+}
+
+
 @dataclass
 class FioJob:
     name: typing.Annotated[
@@ -497,7 +535,7 @@ class FioJob:
 @dataclass
 class FioInput:
     jobs: typing.Annotated[
-        typing.List[FioJob],
+        list[FioJob],
         schema.name("Fio Jobs List"),
         schema.description("List of jobs for fio to run."),
     ]
@@ -510,22 +548,32 @@ class FioInput:
         ),
     ] = False
 
+    include_histograms: typing.Annotated[
+        typing.Optional[bool],
+        schema.name("Include Latency Histograms"),
+        schema.description(
+            "Request fio's json+ output format, which adds the binned IO latency "
+            "samples to the results. The histograms can be orders of magnitude "
+            "larger than the rest of the output, so the plain json format is used "
+            "by default."
+        ),
+    ] = False
+
     def write_jobs_to_file(self, filepath: Path):
-        cfg = configparser.ConfigParser(interpolation=None)
+        filepath.write_text(self.jobs_to_string(), encoding="utf-8")
+
+    def jobs_to_string(self) -> str:
+        # The job file is plain "[section]" and "key=value" lines, so it is
+        # assembled directly rather than through configparser.
+        lines = []
         for job in self.jobs:
-            cfg[job.name] = {}
-            for key, value in asdict(job.params).items():
+            lines.append(f"[{job.name}]\n")
+            for key, formatter in job_params_formatters.items():
+                value = getattr(job.params, key)
                 if value is not None:
-                    if isinstance(value, (bool, int)):
-                        item_value = str(int(value))
-                    else:
-                        item_value = str(value)
-                    cfg[job.name][key] = str(item_value)
-        with open(filepath, "w") as temp:
-            cfg.write(
-                temp,
-                space_around_delimiters=False,
-            )
+                    lines.append(f"{key}={formatter(value)}\n")
+            lines.append("\n")
+        return "".join(lines)
 
 
 @dataclass
@@ -562,14 +610,14 @@ class IoLatency:
             "description": "quantity of IO latency samples collected",
         }
     )
-    percentile: Optional[Dict[str, int]] = field(
+    percentile: Optional[dict[str, int]] = field(
         default=None,
         metadata={
             "name": "IO Latency Cumulative Distribution",
             "description": "Cumulative distribution of IO latency sample",
         },
     )
-    bins: Optional[Dict[str, int]] = field(
+    bins: Optional[dict[str, int]] = field(
         default=None,
         metadata={
             "name": "Binned IO Latency Sample",
@@ -782,7 +830,7 @@ class JobResult:
             "description": "Execution time up to now in seconds.",
         }
     )
-    job_options: Dict[str, str] = field(
+    job_options: dict[str, str] = field(
         metadata={
             "id": "job options",
             "name": "Job Options",
@@ -853,37 +901,37 @@ class JobResult:
             ),
         }
     )
-    iodepth_level: Dict[str, float] = field(
+    iodepth_level: dict[str, float] = field(
         metadata={
             "name": "Total IO Depth Frequency Distribution",
             "description": "Unclear from documentation.",
         }
     )
-    iodepth_submit: Dict[str, float] = field(
+    iodepth_submit: dict[str, float] = field(
         metadata={
             "name": "Submission IO Depth Frequency Distribution",
             "description": "Unclear from documentation.",
         }
     )
-    iodepth_complete: Dict[str, float] = field(
+    iodepth_complete: dict[str, float] = field(
         metadata={
             "name": "Completed IO Depth Frequency Distribution",
             "description": "Unclear from documentation.",
         }
     )
-    latency_ns: Dict[str, float] = field(
+    latency_ns: dict[str, float] = field(
         metadata={
             "name": "Nanosecond Latency Frequency Distribution",
             "description": "Unclear from documentation.",
         }
     )
-    latency_us: Dict[str, float] = field(
+    latency_us: dict[str, float] = field(
         metadata={
             "name": "Microsecond Latency Frequency Distribution",
             "description": "Unclear from documentation.",
         }
     )
-    latency_ms: Dict[str, float] = field(
+    latency_ms: dict[str, float] = field(
         metadata={
             "name": "Millisecond Latency Frequency Distribution",
             "description": "Unclear from documentation.",
@@ -1079,13 +1127,13 @@ class FioSuccessOutput:
             "description": "Human readable datetime string",
         }
     )
-    jobs: typing.List[JobResult] = field(
+    jobs: list[JobResult] = field(
         metadata={
             "name": "Jobs",
             "description": "List of job input parameter configurations",
         }
     )
-    global_options: Optional[Dict[str, str]] = field(
+    global_options: Optional[dict[str, str]] = field(
         default=None,
         metadata={
             "id": "global options",
@@ -1093,7 +1141,7 @@ class FioSuccessOutput:
             "description": "Options applied to every job",
         },
     )
-    disk_util: Optional[typing.List[DiskUtilization]] = field(
+    disk_util: Optional[list[DiskUtilization]] = field(
         default=None,
         metadata={
             "name": "Disk Utlization",
@@ -1102,6 +1150,23 @@ class FioSuccessOutput:
     )
 
 
-fio_input_schema = plugin.build_object_schema(FioInput)
-job_schema = plugin.build_object_schema(JobResult)
-fio_output_schema = plugin.build_object_schema(FioSuccessOutput)
+lazy_object_schemas = {
+    "fio_input_schema": FioInput,
+    "job_schema": JobResult,
+    "fio_output_schema": FioSuccessOutput,
+}
+
+
+def __getattr__(name: str):
+    """Builds the object schemas listed in lazy_object_schemas on demand.
+
+    :param name: the module attribute being looked up
+    :return: the object schema for that name
+    """
+    # Object schemas are built on first access and then cached as regular
+    # module attributes, so importing this module stays cheap.
+    if name in lazy_object_schemas:
+        object_schema = plugin.build_object_schema(lazy_object_schemas[name])
+        globals()[name] = object_schema
+        return object_schema
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,57 +1,328 @@
 #!/usr/bin/env python3
 
 import unittest
+import copy
+import io
 import json
+import os
+import subprocess
 import sys
+import tempfile
 import yaml
 from pathlib import Path
+from unittest import mock
 import fio_plugin
 import fio_schema
 from arcaflow_plugin_sdk import plugin
 
-with open("../fixtures/poisson-rate-submission_output-plus.json", "r") as fout:
-    poisson_submit_outfile = fout.read()
+# Prefer the libyaml-backed loader when PyYAML was built with it
+yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-poisson_submit_output = json.loads(poisson_submit_outfile)
+# Resolve fixtures relative to this file so the tests run from any directory
+fixtures_dir = Path(__file__).resolve().parent.parent / "fixtures"
 
-with open("../fixtures/poisson-rate-submission_input.yaml", "r") as fin:
-    poisson_submit_infile = fin.read()
 
-poisson_submit_input = fio_schema.fio_input_schema.unserialize(
-    yaml.safe_load(poisson_submit_infile)
-)
+class FioPluginTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Read and parse the fixtures once for all tests. The input object is
+        # shared, so tests that modify it must work on a deep copy.
+        cls.poisson_submit_outfile = (
+            fixtures_dir / "poisson-rate-submission_output-plus.json"
+        ).read_text()
 
+        cls.poisson_submit_input = fio_schema.fio_input_schema.unserialize(
+            yaml.load(
+                (
+                    fixtures_dir / "poisson-rate-submission_input.yaml"
+                ).read_bytes(),
+                Loader=yaml_loader,
+            )
+        )
+
+    def setUp(self):
+        # Run every test in its own scratch directory, as fio and the plugin
+        # create their files in the working directory.
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(temp_dir.name)
+
+    def run_with_fake_fio(self, side_effect=None, params=None, **overrides):
+        # Runs the plugin step with subprocess.run patched, by default to
+        # fake_fio_run, and returns its output along with the patched mock.
+        params = copy.deepcopy(params or self.poisson_submit_input)
+        params.cleanup = True
+        for name, value in overrides.items():
+            setattr(params, name, value)
+        with mock.patch.object(
+            fio_plugin.subprocess,
+            "run",
+            side_effect=side_effect or self.fake_fio_run,
+        ) as fio_run:
+            output_id, output_data = fio_plugin.run(
+                params=params, run_id="plugin_ci"
+            )
+        return output_id, output_data, fio_run
 
-class FioPluginTest(unittest.TestCase):
     @staticmethod
-    def test_serialization():
+    def fio_outfile(cmd) -> Path:
+        # The file named by fio's --output option
+        (outfile,) = (
+            arg.split("=", 1)[1] for arg in cmd if arg.startswith("--output=")
+        )
+        return Path(outfile)
+
+    def fake_fio_run(self, cmd, **kwargs):
+        # Stands in for subprocess.run by writing the fixture report to the
+        # fio output file.
+        self.fio_outfile(cmd).write_text(self.poisson_submit_outfile)
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+    def test_serialization(self):
+        plugin.test_object_serialization(self.poisson_submit_input)
+
         plugin.test_object_serialization(
-            fio_schema.fio_input_schema.unserialize(
-                yaml.safe_load(poisson_submit_infile)
+            fio_schema.fio_output_schema.unserialize(
+                json.loads(self.poisson_submit_outfile)
             )
         )
 
+    @staticmethod
+    def test_output_object_serialization():
+        # Small hand-built objects pin down field-level serialization rules,
+        # such as the "min"/"max" ids and the optional fields, independently
+        # of the full fixture.
+        plugin.test_object_serialization(
+            fio_schema.IoLatency(
+                min_=1000,
+                max_=90000,
+                mean=2500.5,
+                stddev=120.25,
+                N=42,
+                percentile={"50.000000": 2400, "99.000000": 85000},
+            )
+        )
+        plugin.test_object_serialization(
+            fio_schema.DiskUtilization(
+                name="sda",
+                read_ios=10,
+                write_ios=20,
+                read_merges=0,
+                write_merges=1,
+                read_ticks=5,
+                write_ticks=6,
+                in_queue=11,
+                util=12.5,
+            )
+        )
         plugin.test_object_serialization(
-            fio_plugin.fio_output_schema.unserialize(poisson_submit_output)
+            fio_schema.FioErrorOutput("fio exited with status 1")
         )
 
-    def test_functional_success(self):
-        input = fio_schema.fio_input_schema.unserialize(
-            yaml.safe_load(poisson_submit_infile)
+    def test_size_patterns(self):
+        for value in [
+            "4096",
+            "0x1000",
+            "4k",
+            "4KiB",
+            "4kb",
+            "4ki",
+            "2G",
+            "1p",
+        ]:
+            self.assertIsNotNone(fio_schema.size_pattern.match(value), value)
+        self.assertIsNotNone(fio_schema.size_pattern.match("4k,8k,16k"))
+        # Only ASCII digits and unit letters are valid for fio, so neither
+        # Arabic-Indic digits nor the Kelvin sign may slip through
+        for value in [
+            "4x",
+            "4kbi",
+            "4kk",
+            "k",
+            "4k,8k,16k,32k",
+            "",
+            "\u0664k",
+            "4\u212a",
+        ]:
+            self.assertIsNone(fio_schema.size_pattern.match(value), value)
+
+        self.assertIsNotNone(fio_schema.size_pattern_with_percent.match("20%"))
+        self.assertIsNone(fio_schema.size_pattern_with_percent.match("101%"))
+        self.assertIsNotNone(fio_schema.size_range_pattern.match("4k-1MiB"))
+        self.assertIsNotNone(
+            fio_schema.size_multi_range_pattern.match("4k-8k,1m-2m,1g-2g")
+        )
+        self.assertIsNone(fio_schema.size_multi_range_pattern.match("4k-8k,"))
+
+    def test_write_jobs_to_file(self):
+        jobfile = Path("fio-input-test.fio")
+        self.poisson_submit_input.write_jobs_to_file(jobfile)
+        self.assertEqual(
+            "[poisson-rate-submit]\n"
+            "buffered=0\n"
+            "readwrite=randrw\n"
+            "size=100KiB\n"
+            "ioengine=sync\n"
+            "iodepth=32\n"
+            "io_submit_mode=inline\n"
+            "rate_iops=50\n"
+            "rate_process=poisson\n"
+            "\n",
+            jobfile.read_text(),
+        )
+
+    def test_job_params_formatters(self):
+        self.assertEqual(
+            "1", fio_schema.job_params_formatters["buffered"](True)
+        )
+
+    def test_split_json_and_errors(self):
+        expected = json.loads(self.poisson_submit_outfile)
+        notes = (
+            "note: both iodepth >= 1 and synchronous I/O engine are selected,"
+            " queue depth will be capped at 1\n"
+            'fio: ignoring option {"verify": 1} for this job\n'
+        )
+        json_data, error_data = fio_plugin.split_json_and_errors(
+            notes + self.poisson_submit_outfile
+        )
+        self.assertEqual(expected, json_data)
+        self.assertEqual(notes, error_data)
+
+        json_data, error_data = fio_plugin.split_json_and_errors(
+            self.poisson_submit_outfile
+        )
+        self.assertEqual(expected, json_data)
+        self.assertEqual("", error_data)
+
+        with self.assertRaises(ValueError):
+            fio_plugin.split_json_and_errors("fio: {bad} option\n")
+
+    def test_cleanup_only_removes_fio_data_files(self):
+        # Job names may also place the data files in another directory,
+        # given either relative to the working directory or absolute
+        Path("sub").mkdir()
+        absolute_name = str(Path.cwd() / "abs")
+        params = fio_schema.fio_input_schema.unserialize(
+            {
+                "jobs": [
+                    {"name": name, "params": {}}
+                    for name in ["db", "sub/db", absolute_name]
+                ]
+            }
         )
+        data_files = [
+            Path("db.0.0"),
+            Path("db.1.12"),
+            Path("sub/db.0.0"),
+            Path(absolute_name + ".0.0"),
+        ]
+        lookalike_files = [
+            Path("db.1.2.bak"),
+            Path("db.2024.05.log"),
+            Path("db.x.0"),
+            Path("dbx.0.0"),
+            Path("sub/db.1.2.bak"),
+            Path("sub/dbx.0.0"),
+            Path(absolute_name + ".0.0.bak"),
+        ]
+        for path in data_files + lookalike_files:
+            path.touch()
+
+        output_id, _, _ = self.run_with_fake_fio(params=params)
+
+        self.assertEqual("success", output_id)
+        for path in data_files:
+            self.assertFalse(path.exists(), path)
+        for path in lookalike_files:
+            self.assertTrue(path.exists(), path)
+
+    def test_output_format(self):
+        for include_histograms, output_format in [
+            (True, "--output-format=json+"),
+            (False, "--output-format=json"),
+        ]:
+            output_id, _, fio_run = self.run_with_fake_fio(
+                include_histograms=include_histograms
+            )
+
+            self.assertEqual("success", output_id)
+            cmd = fio_run.call_args.args[0]
+            self.assertIn(output_format, cmd)
+            self.assertEqual(
+                1, sum(arg.startswith("--output-format=") for arg in cmd)
+            )
+
+    def test_fio_stderr_forwarded_on_success(self):
+        def fio_with_warning(cmd, **kwargs):
+            result = self.fake_fio_run(cmd, **kwargs)
+            result.stderr = b"fio: warning: something to know\n"
+            return result
+
+        with mock.patch.object(fio_plugin.sys, "stderr", io.StringIO()) as err:
+            output_id, _, _ = self.run_with_fake_fio(fio_with_warning)
+
+        self.assertEqual("success", output_id)
+        self.assertIn("fio: warning: something to know", err.getvalue())
+
+        def fio_without_report(cmd, **kwargs):
+            result = fio_with_warning(cmd, **kwargs)
+            self.fio_outfile(cmd).write_text("fio: no report\n")
+            return result
+
+        with mock.patch.object(fio_plugin.sys, "stderr", io.StringIO()) as err:
+            output_id, _, _ = self.run_with_fake_fio(fio_without_report)
+
+        self.assertEqual("error", output_id)
+        self.assertIn("fio: warning: something to know", err.getvalue())
+
+    def test_fio_failure(self):
+        def failing_fio(cmd, **kwargs):
+            # fio writes some of its errors to the output file
+            self.fio_outfile(cmd).write_text(
+                "fio: failed parsing rate_iops=bogus\n"
+            )
+            raise subprocess.CalledProcessError(
+                1, cmd, b"", b"fio: unrecognized option 'bogus'\n"
+            )
+
+        output_id, output_data, _ = self.run_with_fake_fio(failing_fio)
+
+        self.assertEqual("error", output_id)
+        self.assertIn("status 1", output_data.error)
+        self.assertIn("fio: unrecognized option 'bogus'", output_data.error)
+        self.assertIn("fio: failed parsing rate_iops=bogus", output_data.error)
+
+    def test_unwritable_working_directory(self):
+        with mock.patch.object(
+            fio_plugin.tempfile,
+            "mkstemp",
+            side_effect=PermissionError(13, "Permission denied", "."),
+        ):
+            output_id, output_data, fio_run = self.run_with_fake_fio()
+
+        fio_run.assert_not_called()
+
+        self.assertEqual("error", output_id)
+        self.assertIn("Permission denied", output_data.error)
+
+    def test_functional_success(self):
+        input = copy.deepcopy(self.poisson_submit_input)
         input.cleanup = False
         output_id, output_data = fio_plugin.run(
             params=input, run_id="plugin_ci"
         )
+        (outfile,) = Path(".").glob("fio-plus-*.json")
 
-        # if the command didn't succeed, fio-plus.json won't exist.
+        # if the command didn't succeed, the output file will be empty.
         try:
             self.assertEqual("success", output_id)
         except AssertionError:
             sys.stderr.write("Error: {}\n".format(output_data.error))
             raise
 
-        with open("fio-plus.json", "r") as fio_output_file:
+        with open(outfile, "r") as fio_output_file:
             fio_results = fio_output_file.read()
             output_actual: fio_plugin.FioSuccessOutput = (
                 fio_schema.fio_output_schema.unserialize(
@@ -61,10 +332,6 @@ class FioPluginTest(unittest.TestCase):
 
         self.assertEqual(output_data, output_actual)
 
-        Path("fio-plus.json").unlink(missing_ok=True)
-        Path("fio-input-tmp.fio").unlink(missing_ok=True)
-        Path(input.jobs[0].name + ".0.0").unlink(missing_ok=True)
-
 
 if __name__ == "__main__":
     unittest.main()